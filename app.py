@@ -2,6 +2,7 @@
 import streamlit as st
 import os
 import sys
+import uuid
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
@@ -13,7 +14,10 @@ from models.embeddings import get_openai_embeddings
 from utils.rag_helper import get_pdf_text, get_text_chunks, get_vector_store
 from utils.search_helper import get_web_search_tool
 from utils.finance_helper import get_stock_data
-from utils.goal_helper import calculate_tenure, get_investment_basket
+from utils.goal_helper import EXPECTED_RETURNS, build_plan
+from utils.job_helper import get_job_executor, make_job_key
+from utils.session_helper import get_session_manager
+from utils.trace_helper import span, start_trace, record_llm_usage, export_prometheus, cache_hit_rates
 
 def get_chat_response(chat_model, messages, system_prompt, retriever, use_web_search, use_stock_data, response_mode):
     """Get response from the chat model, integrating RAG, Web Search, and Finance Tools."""
@@ -37,7 +41,9 @@ def get_chat_response(chat_model, messages, system_prompt, retriever, use_web_se
 
         if retriever:
             try:
-                relevant_docs = retriever.invoke(last_user_message)
+                with span("rag.retrieve") as attrs:
+                    relevant_docs = retriever.invoke(last_user_message)
+                    attrs["docs"] = len(relevant_docs)
                 context_str += "--- START (Knowledge Base Context) ---\n"
                 for i, doc in enumerate(relevant_docs):
                     context_str += f"Source {i+1}:\n{doc.page_content}\n\n"
@@ -49,7 +55,8 @@ def get_chat_response(chat_model, messages, system_prompt, retriever, use_web_se
             try:
                 search_tool = get_web_search_tool()
                 if search_tool:
-                    search_results = search_tool.invoke(last_user_message)
+                    with span("tavily.search"):
+                        search_results = search_tool.invoke(last_user_message)
                     context_str += f"--- START (Live Web Search Results) ---\n{search_results}\n--- END (Live Web Search Results) ---\n"
                 else:
                     st.warning("Web search is enabled, but TAVILY_API_KEY is not configured.")
@@ -77,7 +84,9 @@ def get_chat_response(chat_model, messages, system_prompt, retriever, use_web_se
             else:
                 formatted_messages.append(AIMessage(content=msg["content"]))
 
-        response = chat_model.invoke(formatted_messages)
+        with span("groq.chat", messages=len(formatted_messages)) as attrs:
+            response = chat_model.invoke(formatted_messages)
+            record_llm_usage("groq.chat", attrs, response)
         return response.content
     
     except Exception as e:
@@ -123,6 +132,9 @@ def chat_page(chat_model, embeddings_model):
     """Main chat interface page"""
     st.title("💸 NeoFin Assistant")
 
+    session_id = st.session_state.session_id
+    session_manager = get_session_manager()
+
     web_search_tool = get_web_search_tool()
 
     if not chat_model:
@@ -176,17 +188,26 @@ def chat_page(chat_model, embeddings_model):
                     try:
                         raw_text = get_pdf_text(uploaded_files)
                         text_chunks = get_text_chunks(raw_text)
-                        st.session_state.retriever = get_vector_store(text_chunks, embeddings_model)
-                        st.success(f"Knowledge Base built from {len(uploaded_files)} file(s)!")
+                        retriever = get_vector_store(text_chunks, embeddings_model)
+                        if retriever is None:
+                            st.error("Failed to build Knowledge Base. Please check the embedding model.")
+                        elif not session_manager.put_retriever(session_id, retriever):
+                            st.error(f"Knowledge Base is too large (limit {settings.get('session_max_mb')} MB per session). Try fewer or smaller files.")
+                        else:
+                            st.success(f"Knowledge Base built from {len(uploaded_files)} file(s)!")
                     except Exception as e:
                         st.error(f"Failed to build Knowledge Base: {e}")
             else:
                 st.warning("Please upload at least one PDF file.")
 
-        if "retriever" in st.session_state:
+        if session_manager.has_retriever(session_id):
             st.success("Knowledge Base is active.")
+            usage = session_manager.usage_report().get(session_id)
+            if usage:
+                resident_mb = (usage["retriever_bytes"] + usage["history_bytes"]) / (1024 * 1024)
+                st.caption(f"Session memory: {resident_mb:.1f} MB" + (" (Knowledge Base parked on disk)" if usage["spilled"] else ""))
             if st.button("Clear Knowledge Base"):
-                del st.session_state.retriever
+                session_manager.release(session_id)
                 st.rerun()
 
     system_prompt = f"""
@@ -217,30 +238,30 @@ def chat_page(chat_model, embeddings_model):
         
         with st.chat_message("assistant"):
             with st.spinner("Analyzing..."):
-                retriever = st.session_state.get("retriever")
-                
-                response = get_chat_response(
-                    chat_model, 
-                    st.session_state.messages, 
-                    system_prompt,
-                    retriever,
-                    use_web_search,
-                    use_stock_data,
-                    response_mode
-                )
+                with start_trace("chat") as trace:
+                    retriever = session_manager.get_retriever(session_id, embeddings_model)
+                    
+                    response = get_chat_response(
+                        chat_model, 
+                        st.session_state.messages, 
+                        system_prompt,
+                        retriever,
+                        use_web_search,
+                        use_stock_data,
+                        response_mode
+                    )
+                st.session_state.last_trace = trace.to_dict()
                 st.markdown(response)
         
         st.session_state.messages.append({"role": "assistant", "content": response})
+        st.session_state.messages = st.session_state.messages[-settings.get("max_chat_messages", 200):]
+        session_manager.record_history(session_id, st.session_state.messages)
 
 def personal_goals_page(chat_model):
     """Page for calculating financial goals and getting a basket."""
     st.title("🎯 Personal Financial Goals")
 
-    expected_returns = {
-        "Low Risk": 0.08,     
-        "Medium Risk": 0.10,  
-        "High Risk": 0.14     
-    }
+    expected_returns = EXPECTED_RETURNS
     
     col1, col2 = st.columns(2)
     
@@ -276,32 +297,107 @@ def personal_goals_page(chat_model):
             st.error("Chat model is not loaded. Please check your GROQ_API_KEY.")
             return
 
-        with st.spinner("Calculating tenure and building your basket..."):
-            annual_rate = expected_returns[risk_profile]
-            tenure_years = calculate_tenure(goal_amount, investment_type, amount, annual_rate, is_step_up, step_up_percent)
-            
-            st.subheader(f"Step 1: Estimated Time Horizon")
-            if isinstance(tenure_years, str) and tenure_years == "Error":
-                st.error("Could not calculate tenure. Your goal may be unreachable with these inputs.")
-            elif isinstance(tenure_years, str):
-                st.warning(f"Your goal will take **over {tenure_years} years** to reach with this plan.")
-            else:
-                st.success(f"It will take approximately **{tenure_years} years** to reach your goal of ${goal_amount:,.2f}.")
-
-            if not isinstance(tenure_years, str):
-                st.subheader(f"Step 2: Suggested Investment Basket")
-                basket_recommendation = get_investment_basket(
-                    chat_model, 
-                    goal_amount, 
-                    risk_profile, 
-                    investment_type, 
-                    amount, 
-                    tenure_years
-                )
-                st.markdown(basket_recommendation)
-            else:
-                st.info("A basket could not be generated as the tenure calculation was not successful.")
-
+        annual_rate = expected_returns[risk_profile]
+        job_key = make_job_key(
+            "plan",
+            model=settings.get("groq_model_name"),
+            goal_amount=goal_amount,
+            risk_profile=risk_profile,
+            investment_type=investment_type,
+            amount=amount,
+            annual_rate=annual_rate,
+            is_step_up=is_step_up,
+            step_up_percent=step_up_percent
+        )
+        job_id = get_job_executor().submit(
+            job_key,
+            build_plan,
+            chat_model,
+            goal_amount,
+            risk_profile,
+            investment_type,
+            amount,
+            annual_rate,
+            is_step_up,
+            step_up_percent
+        )
+        if job_id:
+            st.session_state.plan_job_id = job_id
+        else:
+            st.warning("The planner is busy right now. Please try again in a moment.")
+
+    job_id = st.session_state.get("plan_job_id")
+    if not job_id:
+        return
+
+    job = get_job_executor().get(job_id)
+    if job is None:
+        del st.session_state.plan_job_id
+        st.info("Your previous plan has expired. Click \"Build My Plan\" to generate a new one.")
+    elif job["status"] in ("queued", "running"):
+        plan_job_progress(job_id)
+    elif job["status"] == "failed":
+        st.error(f"An error occurred while building your plan: {job['error']}")
+    else:
+        st.session_state.last_trace = job["trace"]
+        show_plan_result(job["result"])
+
+@st.fragment(run_every=1.0)
+def plan_job_progress(job_id):
+    """Polls a background plan job and reruns the page once it has finished."""
+    job = get_job_executor().get(job_id)
+    if job is None or job["status"] not in ("queued", "running"):
+        st.rerun()
+    st.progress(job["progress"], text=job["stage"])
+
+def show_plan_result(plan):
+    """Render the output of a finished plan job."""
+    goal_amount = plan["goal_amount"]
+    tenure_years = plan["tenure_years"]
+
+    st.subheader(f"Step 1: Estimated Time Horizon")
+    if isinstance(tenure_years, str) and tenure_years == "Error":
+        st.error("Could not calculate tenure. Your goal may be unreachable with these inputs.")
+    elif isinstance(tenure_years, str):
+        st.warning(f"Your goal will take **over {tenure_years} years** to reach with this plan.")
+    else:
+        st.success(f"It will take approximately **{tenure_years} years** to reach your goal of ${goal_amount:,.2f}.")
+
+    if not isinstance(tenure_years, str):
+        st.subheader(f"Step 2: Suggested Investment Basket")
+        st.markdown(plan["basket_recommendation"])
+    else:
+        st.info("A basket could not be generated as the tenure calculation was not successful.")
+
+
+def performance_panel():
+    """Sidebar debug panel with the span breakdown of the last request."""
+    with st.expander("⏱️ Performance (last request)"):
+        trace = st.session_state.get("last_trace")
+        if not trace:
+            st.caption("No request traced yet in this session.")
+        else:
+            st.markdown(f"**{trace['name']}** took **{trace['duration_ms']:,.0f} ms**")
+            st.dataframe(
+                [
+                    {
+                        "span": s["name"],
+                        "start (ms)": s["offset_ms"],
+                        "duration (ms)": s["duration_ms"],
+                        "error": s["error"],
+                        "details": ", ".join(f"{k}={v}" for k, v in s["attributes"].items()),
+                    }
+                    for s in trace["spans"]
+                ],
+                hide_index=True,
+                use_container_width=True
+            )
+
+        hit_rates = cache_hit_rates()
+        if hit_rates:
+            st.caption("Cache hit rates: " + ", ".join(f"{name} {rate:.0%}" for name, rate in sorted(hit_rates.items())))
+
+        st.download_button("Download metrics (Prometheus)", export_prometheus(), file_name="neofin_metrics.prom", mime="text/plain")
 
 def main():
     st.set_page_config(
@@ -318,6 +414,9 @@ def main():
         st.error(f"Error loading models: {e}")
         chat_model, embeddings_model = None, None
 
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
     with st.sidebar:
         st.title("NeoFin Assistant")
         page = st.radio(
@@ -330,6 +429,7 @@ def main():
             st.divider()
             if st.button("Clear Chat History", use_container_width=True):
                 st.session_state.messages = []
+                get_session_manager().record_history(st.session_state.session_id, [])
                 st.rerun()
 
     if page == "Instructions":
@@ -339,5 +439,9 @@ def main():
     if page == "Personal Goals":
         personal_goals_page(chat_model) 
 
+    if settings.get("trace_debug_panel"):
+        with st.sidebar:
+            performance_panel()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
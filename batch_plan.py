@@ -0,0 +1,35 @@
+# batch_plan.py
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from groq import AuthenticationError
+from models.llm import get_chatgroq_model
+from utils.batch_helper import run_batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Build investment plans for a whole book of clients without the UI.")
+    parser.add_argument("input", help="CSV or Parquet file with client_id, goal_amount, risk_profile, investment_type, amount "
+                                      "and optionally is_step_up, step_up_percent, annual_rate.")
+    parser.add_argument("output", help="JSON lines file to append plans to. Re-running with the same file resumes.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum LLM calls in flight (default: 4).")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per LLM call before giving up on a client (default: 3).")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Initial retry backoff in seconds, doubled each attempt (default: 2.0).")
+    parser.add_argument("--metrics", default=None, help="Where to write Prometheus metrics for the run (default: <output>.prom).")
+    args = parser.parse_args()
+
+    # run_batch retries transient errors itself, so the client must not retry as well.
+    chat_model = get_chatgroq_model(max_retries=0)
+    if not chat_model:
+        print("Chat model is not loaded. Please check your GROQ_API_KEY.")
+        sys.exit(1)
+
+    try:
+        run_batch(chat_model, args.input, args.output, concurrency=args.concurrency, retries=args.retries, backoff_seconds=args.backoff, metrics_path=args.metrics)
+    except AuthenticationError:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
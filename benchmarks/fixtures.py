@@ -0,0 +1,186 @@
+# benchmarks/fixtures.py
+import random
+import tempfile
+import time
+from contextlib import contextmanager, ExitStack
+from unittest import mock
+import numpy as np
+import pandas as pd
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+REPORT_WORDS = (
+    "equity bond yield inflation outlook earnings growth volatility sector rates "
+    "duration credit spread dividend valuation momentum allocation liquidity risk "
+    "emerging developed commodity gold currency policy central bank recession"
+).split()
+
+
+def synthetic_price_history(tickers, start, end, seed=0):
+    """
+    Deterministic multi-ticker daily history shaped like
+    yf.download(..., group_by='ticker', auto_adjust=False).
+    Each ticker follows a geometric random walk with its own drift and volatility.
+    """
+    dates = pd.bdate_range(start=start, end=end)
+    frames = {}
+    for i, ticker in enumerate(tickers):
+        rng = np.random.default_rng(seed + i)
+        drift = rng.uniform(0.0, 0.15) / 252
+        vol = rng.uniform(0.03, 0.8) / np.sqrt(252)
+        log_returns = rng.normal(drift - vol ** 2 / 2, vol, len(dates))
+        close = 100 * np.exp(np.cumsum(log_returns))
+        frames[ticker] = pd.DataFrame({
+            "Open": close * (1 + rng.normal(0, 0.002, len(dates))),
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Close": close,
+            "Adj Close": close * 0.98,
+            "Volume": rng.integers(1_000_000, 10_000_000, len(dates)),
+        }, index=dates)
+    return pd.concat(frames, axis=1)
+
+
+class FakeTicker:
+    """Stand-in for yf.Ticker with a static, deterministic .info payload."""
+
+    def __init__(self, symbol):
+        rng = random.Random(symbol)
+        price = round(rng.uniform(20, 500), 2)
+        self.info = {
+            "longName": f"{symbol} Synthetic Fund",
+            "currentPrice": price,
+            "dayHigh": round(price * 1.01, 2),
+            "dayLow": round(price * 0.99, 2),
+            "marketCap": rng.randint(10**9, 10**12),
+            "fiftyTwoWeekHigh": round(price * 1.2, 2),
+            "fiftyTwoWeekLow": round(price * 0.8, 2),
+            "longBusinessSummary": " ".join(rng.choice(REPORT_WORDS) for _ in range(120)),
+        }
+
+
+class FakeYFinance:
+    """Offline replacement for the yfinance module: download() and Ticker()."""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self._recorded = {}
+
+    def download(self, tickers, start=None, end=None, group_by="column", **kwargs):
+        # Generated once per request shape and then replayed, like a recorded response.
+        key = (tuple(tickers), pd.Timestamp(start).date(), pd.Timestamp(end).date())
+        if key not in self._recorded:
+            self._recorded[key] = synthetic_price_history(tickers, start, end, seed=self.seed)
+        data = self._recorded[key]
+        if group_by == "ticker":
+            return data
+        return data.swaplevel(axis=1).sort_index(axis=1)
+
+    def Ticker(self, symbol):
+        return FakeTicker(symbol)
+
+
+class FakeSearchTool:
+    """Offline replacement for the Tavily search tool."""
+
+    def __init__(self, latency_seconds=0.0, results=3):
+        self.latency_seconds = latency_seconds
+        self.results = results
+
+    def invoke(self, query):
+        time.sleep(self.latency_seconds)
+        rng = random.Random(query)
+        return [
+            {"url": f"https://news.example.com/{i}", "content": " ".join(rng.choice(REPORT_WORDS) for _ in range(80))}
+            for i in range(self.results)
+        ]
+
+
+class FakeChatModel:
+    """Offline replacement for ChatGroq with configurable latency and output size."""
+
+    def __init__(self, latency_seconds=0.05, output_tokens=400):
+        self.latency_seconds = latency_seconds
+        self.output_tokens = output_tokens
+
+    def invoke(self, messages):
+        time.sleep(self.latency_seconds)
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        content = " ".join(REPORT_WORDS[i % len(REPORT_WORDS)] for i in range(self.output_tokens))
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": input_tokens + self.output_tokens,
+            },
+        )
+
+
+def fake_embeddings(size=384):
+    """Deterministic hash-based embeddings, same width as all-MiniLM-L6-v2."""
+    return DeterministicFakeEmbedding(size=size)
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_report_pdf(pages=10, lines_per_page=45, seed=0):
+    """Builds a small text-only PDF market report in memory and returns its bytes."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(REPORT_WORDS) for _ in range(12)) + "." for _ in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+@contextmanager
+def offline_services(search_latency_seconds=0.0, seed=0):
+    """Route yfinance and Tavily lookups in the app modules to the offline fakes."""
+    import app
+    import utils.finance_helper as finance_helper
+    import utils.goal_helper as goal_helper
+    import utils.market_data_helper as market_data_helper
+    from config.config import settings
+
+    fake_yf = FakeYFinance(seed=seed)
+    search_tool = FakeSearchTool(latency_seconds=search_latency_seconds)
+    with ExitStack() as stack:
+        # A private price-matrix directory so runs never reuse real or stale market data.
+        market_data_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="neofin_bench_"))
+        stack.enter_context(mock.patch.dict(settings, {"market_data_dir": market_data_dir}))
+        stack.enter_context(mock.patch.object(market_data_helper, "_mapped", None))
+        stack.enter_context(mock.patch.object(market_data_helper, "yf", fake_yf))
+        stack.enter_context(mock.patch.object(finance_helper, "yf", fake_yf))
+        stack.enter_context(mock.patch.object(goal_helper, "get_web_search_tool", lambda: search_tool))
+        stack.enter_context(mock.patch.object(app, "get_web_search_tool", lambda: search_tool))
+        yield
+
@@ -0,0 +1,206 @@
+# benchmarks/run_benchmarks.py
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+
+import utils.market_data_helper as market_data_helper
+from app import get_chat_response
+from config.config import settings
+from benchmarks.fixtures import FakeChatModel, build_report_pdf, fake_embeddings, offline_services
+from utils.goal_helper import ASSET_UNIVERSE, EXPECTED_RETURNS, calculate_tenure, calculate_tenures, _get_historical_performance, get_investment_basket
+from utils.rag_helper import get_pdf_text, get_text_chunks, get_vector_store
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _tenure_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "goal_amount": rng.uniform(1e4, 5e6, n),
+        "investment_type": rng.choice(["SIP", "Lumpsum"], n),
+        "amount": rng.uniform(100, 5e4, n),
+        "annual_rate": rng.choice(list(EXPECTED_RETURNS.values()), n),
+        "is_step_up": rng.random(n) < 0.5,
+        "step_up_percent": rng.integers(1, 21, n).astype(float),
+    })
+
+
+def bench_calculate_tenure(args):
+    rows = list(_tenure_inputs(1000).itertuples(index=False))
+
+    def run():
+        for r in rows:
+            calculate_tenure(r.goal_amount, r.investment_type, r.amount, r.annual_rate, r.is_step_up, r.step_up_percent)
+    return run
+
+
+def bench_calculate_tenures(args):
+    goals = _tenure_inputs(10000)
+    return lambda: calculate_tenures(goals)
+
+
+def bench_historical_performance(args):
+    # After the warmup run this measures the warm path: mapping the published matrix and computing on it.
+    return lambda: _get_historical_performance(ASSET_UNIVERSE, years=15)
+
+
+def bench_historical_performance_cold(args):
+    # Every run starts from an empty market-data directory, so it covers
+    # download -> float32 matrix -> publish -> map -> compute.
+    def run():
+        with tempfile.TemporaryDirectory(prefix="neofin_bench_") as market_data_dir, \
+                mock.patch.dict(settings, {"market_data_dir": market_data_dir}), \
+                mock.patch.object(market_data_helper, "_mapped", None):
+            _get_historical_performance(ASSET_UNIVERSE, years=15)
+    return run
+
+
+def bench_investment_basket(args):
+    chat_model = FakeChatModel(args.llm_latency, args.llm_tokens)
+    return lambda: get_investment_basket(chat_model, 1_000_000, "Medium Risk", "SIP", 500, 20.5)
+
+
+def bench_rag_ingest(args):
+    pdf = build_report_pdf(pages=args.pdf_pages)
+    embeddings = fake_embeddings()
+
+    def run():
+        raw_text = get_pdf_text([io.BytesIO(pdf)])
+        text_chunks = get_text_chunks(raw_text)
+        get_vector_store(text_chunks, embeddings)
+    return run
+
+
+def bench_chat_response(args):
+    chat_model = FakeChatModel(args.llm_latency, args.llm_tokens)
+    raw_text = get_pdf_text([io.BytesIO(build_report_pdf(pages=args.pdf_pages))])
+    retriever = get_vector_store(get_text_chunks(raw_text), fake_embeddings())
+    messages = [
+        {"role": "user", "content": "How do bonds look this year?"},
+        {"role": "assistant", "content": "Bond yields have risen, which improves forward returns."},
+        {"role": "user", "content": "Compare VOO and QQQ for a medium risk investor."},
+    ]
+    return lambda: get_chat_response(chat_model, messages, "You are NeoFin.", retriever, True, True, "Detailed")
+
+
+BENCHMARKS = {
+    "calculate_tenure_1k": bench_calculate_tenure,
+    "calculate_tenures_10k": bench_calculate_tenures,
+    "historical_performance": bench_historical_performance,
+    "historical_performance_cold": bench_historical_performance_cold,
+    "investment_basket": bench_investment_basket,
+    "rag_ingest": bench_rag_ingest,
+    "chat_response": bench_chat_response,
+}
+
+
+def run_benchmark(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "mean_s": statistics.mean(timings),
+        "repeat": repeat,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the names of benchmarks whose best run is slower than the baseline's
+    by more than tolerance. Best-of-N is less sensitive to scheduler noise than the median.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<26}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"{name:<26}{'-':>12}{result['min_s'] * 1000:>10.2f}ms{'new':>10}")
+            continue
+        change = result["min_s"] / base["min_s"] - 1
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{name:<26}{base['min_s'] * 1000:>10.2f}ms{result['min_s'] * 1000:>10.2f}ms{change:>+10.1%}{flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for NeoFin's hot paths.")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all). Choices: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per benchmark (default: 7).")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs before timing (default: 1).")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM latency in seconds (default: 0.05).")
+    parser.add_argument("--llm-tokens", type=int, default=400, help="Fake LLM output tokens (default: 400).")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="Fake Tavily latency in seconds (default: 0).")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="Pages in the synthetic PDF report (default: 20).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare against or save to.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline before flagging (default: 0.25).")
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {unknown}")
+
+    fixture_settings = {
+        "llm_latency": args.llm_latency,
+        "llm_tokens": args.llm_tokens,
+        "search_latency": args.search_latency,
+        "pdf_pages": args.pdf_pages,
+    }
+
+    results = {}
+    with offline_services(search_latency_seconds=args.search_latency):
+        for name in names:
+            fn = BENCHMARKS[name](args)
+            results[name] = run_benchmark(fn, args.repeat, args.warmup)
+            print(f"{name}: best {results[name]['min_s'] * 1000:.2f}ms, median {results[name]['median_s'] * 1000:.2f}ms")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "settings": fixture_settings,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}. Run with --save-baseline to create one.")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != fixture_settings:
+        print(f"\nWarning: fixture settings differ from the baseline's {baseline.get('settings')}; timings may not be comparable.")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
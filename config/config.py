@@ -1,5 +1,6 @@
 # config/config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,6 +17,19 @@ def get_config():
             "google_api_key": os.environ.get("GOOGLE_API_KEY"), 
             "groq_model_name": os.environ.get("GROQ_MODEL_NAME", "llama-3.1-8b-instant"),
             "embedding_model_name": os.environ.get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"),
+            "job_max_workers": int(os.environ.get("JOB_MAX_WORKERS", "2")),
+            "job_max_queue": int(os.environ.get("JOB_MAX_QUEUE", "8")),
+            "session_idle_seconds": int(os.environ.get("SESSION_IDLE_SECONDS", "600")),
+            "session_disk_ttl_seconds": int(os.environ.get("SESSION_DISK_TTL_SECONDS", "86400")),
+            "session_max_mb": int(os.environ.get("SESSION_MAX_MB", "256")),
+            "global_session_max_mb": int(os.environ.get("GLOBAL_SESSION_MAX_MB", "1024")),
+            "session_spill_dir": os.environ.get("SESSION_SPILL_DIR", os.path.join(tempfile.gettempdir(), "neofin_sessions")),
+            "max_chat_messages": int(os.environ.get("MAX_CHAT_MESSAGES", "200")),
+            "trace_jsonl_path": os.environ.get("TRACE_JSONL_PATH"),
+            "market_data_dir": os.environ.get("MARKET_DATA_DIR", os.path.join(tempfile.gettempdir(), "neofin_market_data")),
+            "market_data_max_age_seconds": int(os.environ.get("MARKET_DATA_MAX_AGE_SECONDS", "21600")),
+            "market_data_retry_seconds": int(os.environ.get("MARKET_DATA_RETRY_SECONDS", "300")),
+            "trace_debug_panel": os.environ.get("TRACE_DEBUG_PANEL", "false").lower() == "true",
         }
         
         if not config_settings["groq_api_key"]:
@@ -4,6 +4,7 @@ import sys
 from langchain_community.embeddings import HuggingFaceEmbeddings, OpenAIEmbeddings
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from config.config import settings
+from utils.trace_helper import span
 
 def get_openai_embeddings():
     """
@@ -33,11 +34,12 @@ def get_openai_embeddings():
             
         # Initialize HuggingFaceEmbeddings to run locally
         # This will download the model the first time it's run
-        embeddings = HuggingFaceEmbeddings(
-            model_name=model_name,
-            model_kwargs={'device': 'cpu'}, 
-            encode_kwargs={'normalize_embeddings': True} 
-        )
+        with span("model.load_embeddings", model=model_name):
+            embeddings = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': 'cpu'}, 
+                encode_kwargs={'normalize_embeddings': True} 
+            )
         
         print(f"Successfully loaded local embedding model: {model_name}")
         return embeddings
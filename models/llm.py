@@ -4,9 +4,13 @@ import sys
 from langchain_groq import ChatGroq
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from config.config import settings
+from utils.trace_helper import span
 
-def get_chatgroq_model():
-    """Initialize and return the Groq chat model"""
+def get_chatgroq_model(max_retries=2):
+    """
+    Initialize and return the Groq chat model.
+    Callers with their own retry policy pass max_retries=0 so requests are not retried twice.
+    """
     try:
         groq_api_key = settings.get("groq_api_key")
         model_name = settings.get("groq_model_name")
@@ -14,10 +18,12 @@ def get_chatgroq_model():
         if not groq_api_key:
             return None
 
-        groq_model = ChatGroq(
-            api_key=groq_api_key,
-            model=model_name,
-        )
+        with span("model.load_llm", model=model_name):
+            groq_model = ChatGroq(
+                api_key=groq_api_key,
+                model=model_name,
+                max_retries=max_retries,
+            )
         return groq_model
     except Exception as e:
         print(f"Failed to initialize Groq model: {str(e)}")
@@ -0,0 +1,229 @@
+# utils/batch_helper.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+import pandas as pd
+from groq import APIConnectionError, APITimeoutError, AuthenticationError, InternalServerError, RateLimitError
+from utils.goal_helper import EXPECTED_RETURNS, calculate_tenures, build_market_contexts, build_basket_messages
+from utils.trace_helper import start_trace, span, record_llm_usage, export_prometheus
+
+REQUIRED_COLUMNS = ["client_id", "goal_amount", "risk_profile", "investment_type", "amount"]
+INVESTMENT_TYPES = ("SIP", "Lumpsum")
+# Errors worth retrying. Anything else (bad request, permission denied, ...) will fail the same way again.
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def load_goals(input_path):
+    """
+    Reads a CSV or Parquet file of client goals and fills in optional columns.
+    annual_rate defaults to the risk profile's expected return. Rows with an
+    unknown risk_profile or investment_type get an input_error and are not planned.
+    """
+    if input_path.lower().endswith(".parquet"):
+        goals = pd.read_parquet(input_path)
+    else:
+        goals = pd.read_csv(input_path)
+
+    missing = [col for col in REQUIRED_COLUMNS if col not in goals.columns]
+    if missing:
+        raise ValueError(f"Input file is missing required columns: {missing}")
+
+    goals["client_id"] = goals["client_id"].astype(str)
+    if "is_step_up" not in goals.columns:
+        goals["is_step_up"] = False
+    if "step_up_percent" not in goals.columns:
+        goals["step_up_percent"] = 0.0
+    if "annual_rate" not in goals.columns:
+        goals["annual_rate"] = goals["risk_profile"].map(EXPECTED_RETURNS)
+
+    goals["is_step_up"] = goals["is_step_up"].fillna(False).astype(bool)
+    goals["step_up_percent"] = goals["step_up_percent"].fillna(0.0)
+    goals["annual_rate"] = goals["annual_rate"].fillna(goals["risk_profile"].map(EXPECTED_RETURNS))
+
+    goals["input_error"] = None
+    bad_type = ~goals["investment_type"].isin(INVESTMENT_TYPES)
+    goals.loc[bad_type, "input_error"] = f"Unknown investment_type. Expected one of {list(INVESTMENT_TYPES)}."
+    bad_profile = ~goals["risk_profile"].isin(list(EXPECTED_RETURNS))
+    goals.loc[bad_profile, "input_error"] = f"Unknown risk_profile. Expected one of {list(EXPECTED_RETURNS)}."
+    return goals
+
+
+def load_checkpoint(output_path):
+    """
+    Returns the client ids already planned in the output file.
+    Rows marked retryable (transient LLM errors or missing market data) are
+    left out so a re-run retries them; the newer line for a client supersedes
+    the older one. Rows with permanent errors, such as invalid input or a
+    rejected prompt, count as done.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run is simply redone.
+                continue
+            if not record.get("retryable"):
+                done.add(record["client_id"])
+    return done
+
+
+def _terminate_partial_line(output_path):
+    """Ends a line cut off by an interrupted run so new results start on a fresh line."""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def _invoke_with_retry(chat_model, messages, retries, backoff_seconds):
+    """Calls the LLM, retrying with exponential backoff on transient errors only."""
+    for attempt in range(retries + 1):
+        try:
+            with span("groq.basket", attempt=attempt) as attrs:
+                response = chat_model.invoke(messages)
+                record_llm_usage("groq.basket", attrs, response)
+            return response.content
+        except TRANSIENT_ERRORS as e:
+            if attempt == retries:
+                raise
+            wait_seconds = backoff_seconds * (2 ** attempt)
+            print(f"LLM call failed ({e}). Retrying in {wait_seconds:.1f}s...")
+            time.sleep(wait_seconds)
+
+
+def _plan_row(chat_model, row, tenure_years, contexts, retries, backoff_seconds):
+    """Plans one client inside its own trace, so TRACE_JSONL_PATH gets one line per client."""
+    with start_trace("batch_plan"), span("batch.plan_row", client_id=row["client_id"]) as attrs:
+        result = _build_plan(chat_model, row, tenure_years, contexts, retries, backoff_seconds)
+        attrs["error"] = result["error"]
+    return result
+
+
+def _build_plan(chat_model, row, tenure_years, contexts, retries, backoff_seconds):
+    result = {
+        "client_id": row["client_id"],
+        "goal_amount": float(row["goal_amount"]),
+        "risk_profile": row["risk_profile"],
+        "investment_type": row["investment_type"],
+        "amount": float(row["amount"]),
+        "tenure_years": tenure_years,
+        "basket_recommendation": None,
+        "error": None,
+        "retryable": False,
+    }
+
+    if row["input_error"]:
+        result["error"] = row["input_error"]
+        return result
+
+    if isinstance(tenure_years, str) or tenure_years is None:
+        result["error"] = "Tenure calculation was not successful."
+        return result
+
+    context_str = contexts.get(row["risk_profile"])
+    if context_str is None:
+        result["error"] = "No market data available for this risk profile."
+        result["retryable"] = True
+        return result
+
+    messages = build_basket_messages(context_str, row["goal_amount"], row["risk_profile"], row["investment_type"], row["amount"], tenure_years)
+    try:
+        result["basket_recommendation"] = _invoke_with_retry(chat_model, messages, retries, backoff_seconds)
+    except AuthenticationError:
+        # Every other client would fail the same way, so let run_batch stop the run.
+        raise
+    except TRANSIENT_ERRORS as e:
+        result["error"] = str(e)
+        result["retryable"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def run_batch(chat_model, input_path, output_path, concurrency=4, retries=3, backoff_seconds=2.0, contexts=None, metrics_path=None):
+    """
+    Builds plans for every client in input_path and appends them to output_path
+    as JSON lines. Clients already in output_path are skipped, so an
+    interrupted run resumes where it stopped. Timing, token and cache metrics for
+    the run are written in Prometheus text format to metrics_path
+    (default: output_path + ".prom").
+
+    Tenures are computed in one vectorized pass, the market data and per-profile
+    context are fetched once for the whole book, and at most `concurrency`
+    LLM calls are in flight at a time. chat_model should have its own retries
+    disabled (max_retries=0); transient errors are retried here.
+    Raises groq.AuthenticationError, after writing the plans already finished,
+    if the API key is rejected.
+    """
+    goals = load_goals(input_path)
+    done = load_checkpoint(output_path)
+    pending = goals[~goals["client_id"].isin(done)]
+    print(f"{len(goals)} clients in input, {len(done)} already done, {len(pending)} to plan.")
+
+    if pending.empty:
+        return 0
+
+    with start_trace("batch_setup"):
+        with span("goal.tenures", rows=len(pending)):
+            tenures = calculate_tenures(pending)
+
+        valid_profiles = pending.loc[pending["input_error"].isnull(), "risk_profile"].unique()
+        if contexts is None and len(valid_profiles) == 0:
+            contexts = {}
+        elif contexts is None:
+            contexts = build_market_contexts(valid_profiles)
+            if not contexts:
+                print("Could not retrieve historical market data. Rows will be written with an error.")
+
+    _terminate_partial_line(output_path)
+
+    written = 0
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+
+        def drain(return_when):
+            nonlocal in_flight, written
+            finished, in_flight = wait(in_flight, return_when=return_when)
+            auth_error = None
+            for future in finished:
+                if isinstance(future.exception(), AuthenticationError):
+                    auth_error = future.exception()
+                    continue
+                out.write(json.dumps(future.result(), default=str) + "\n")
+                written += 1
+            out.flush()
+            if auth_error:
+                for future in in_flight:
+                    future.cancel()
+                print(f"Groq rejected the API key ({auth_error}). Stopping after {written} plans; re-run to resume.")
+                raise auth_error
+
+        for index, row in pending.iterrows():
+            # Keep the queue short so memory stays flat on large books.
+            if len(in_flight) >= concurrency * 2:
+                drain(FIRST_COMPLETED)
+            in_flight.add(pool.submit(_plan_row, chat_model, row, tenures[index], contexts, retries, backoff_seconds))
+
+        if in_flight:
+            drain(ALL_COMPLETED)
+
+    print(f"Wrote {written} plans to {output_path}.")
+    _write_metrics(metrics_path or f"{output_path}.prom")
+    return written
+
+
+def _write_metrics(metrics_path):
+    try:
+        with open(metrics_path, "w", encoding="utf-8") as f:
+            f.write(export_prometheus())
+        print(f"Wrote run metrics to {metrics_path}.")
+    except OSError as e:
+        print(f"Error writing metrics to {metrics_path}: {e}")
@@ -1,6 +1,7 @@
 # utils/finance_helper.py
 import yfinance as yf
 from langchain.tools import tool
+from utils.trace_helper import span
 
 @tool
 def get_stock_data(ticker_symbol: str):
@@ -9,8 +10,9 @@ def get_stock_data(ticker_symbol: str):
     Includes current price, day's high/low, and market cap.
     """
     try:
-        stock = yf.Ticker(ticker_symbol)
-        info = stock.info
+        with span("yfinance.info", ticker=ticker_symbol):
+            stock = yf.Ticker(ticker_symbol)
+            info = stock.info
         
         data = {
             "symbol": ticker_symbol,
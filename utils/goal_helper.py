@@ -1,12 +1,66 @@
 # utils/goal_helper.py
 import math
-import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 from langchain_core.messages import SystemMessage, HumanMessage
 from utils.search_helper import get_web_search_tool
 from utils.finance_helper import get_stock_data
+from utils.trace_helper import span, record_llm_usage
+from utils.market_data_helper import get_price_matrix
+
+ASSET_UNIVERSE = [
+    # US Equity (Large Cap)
+    'VOO',  # S&P 500
+    'VUG',  # S&P 500 Growth
+    'VTV',  # S&P 500 Value
+    
+    # US Equity (Mid/Small Cap)
+    'VO',   # Mid-Cap
+    'VB',   # Small-Cap
+    
+    # US Tech / Sectors
+    'QQQ',  # NASDAQ 100
+    'XLK',  # Technology
+    'XLF',  # Financials
+    'XLV',  # Health Care
+    'XLE',  # Energy
+    
+    # International Equity
+    'VEU',  # All-World ex-US
+    'EEM',  # Emerging Markets
+    'EFA',  # Developed (EAFE)
+    'VGK',  # Europe
+    
+    # Bonds (Government)
+    'BND',  # Total US Bond Market
+    'TLT',  # 20+ Year Treasury
+    'SHY',  # 1-3 Year Treasury
+    'BNDX', # Total International Bond
+    
+    # Bonds (Corporate)
+    'LQD',  # Investment Grade Corporate
+    'HYG',  # High-Yield Corporate (Junk)
+    
+    # Real Estate
+    'VNQ',  # US Real Estate
+    'VNQI', # International Real Estate
+    
+    # Commodities
+    'GLD',  # Gold
+    'SLV',  # Silver
+    'DBC',  # Broad Commodities (Oil, Gas, Gold, etc.)
+    
+    # Crypto (Note: yfinance uses -USD)
+    'BTC-USD', # Bitcoin
+    'ETH-USD'  # Ethereum
+]
+
+# Default annual return assumptions per risk profile.
+EXPECTED_RETURNS = {
+    "Low Risk": 0.08,
+    "Medium Risk": 0.10,
+    "High Risk": 0.14
+}
 
 def _simulate_step_up_sip(goal_amount, initial_monthly_sip, annual_rate, step_up_percent):
     """Internal helper to simulate step-up SIP growth year by year."""
@@ -34,6 +88,11 @@ def calculate_tenure(goal_amount, investment_type, amount, annual_rate, is_step_
     """
     Calculates the estimated time (in years) to reach the financial goal.
     """
+    with span("goal.tenure", investment_type=investment_type, step_up=is_step_up):
+        return _calculate_tenure(goal_amount, investment_type, amount, annual_rate, is_step_up, step_up_percent)
+
+def _calculate_tenure(goal_amount, investment_type, amount, annual_rate, is_step_up, step_up_percent):
+    """Internal helper with the closed-form tenure maths, timed by calculate_tenure."""
     try:
         r_monthly = annual_rate / 12
         
@@ -53,196 +112,288 @@ def calculate_tenure(goal_amount, investment_type, amount, annual_rate, is_step_
         print(f"Error in tenure calculation: {e}")
         return "Error"
 
+def calculate_tenures(goals):
+    """
+    Vectorized calculate_tenure over a DataFrame with columns goal_amount,
+    investment_type, amount, annual_rate, is_step_up and step_up_percent.
+    Returns a Series with the same values calculate_tenure would give per row.
+    """
+    goal_amount = goals["goal_amount"].to_numpy(dtype=float)
+    amount = goals["amount"].to_numpy(dtype=float)
+    annual_rate = goals["annual_rate"].to_numpy(dtype=float)
+    is_step_up = goals["is_step_up"].to_numpy(dtype=bool)
+    step_up_rate = goals["step_up_percent"].to_numpy(dtype=float) / 100.0
+    investment_type = goals["investment_type"].to_numpy()
+    r_monthly = annual_rate / 12
+
+    lumpsum = investment_type == "Lumpsum"
+    sip = (investment_type == "SIP") & ~is_step_up
+    step_up = (investment_type == "SIP") & is_step_up
+
+    tenures = np.full(len(goals), None, dtype=object)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        n_years = np.log(goal_amount / amount) / np.log(1 + annual_rate)
+        n_months = np.log(((goal_amount / amount) * r_monthly) + 1) / np.log(1 + r_monthly)
+
+    for mask, values in ((lumpsum, n_years), (sip, n_months / 12)):
+        ok = mask & np.isfinite(values)
+        tenures[ok] = np.round(values[ok], 1)
+        tenures[mask & ~np.isfinite(values)] = "Error"
+
+    if step_up.any():
+        corpus = np.zeros(step_up.sum())
+        monthly_sip = amount[step_up]
+        step_goal = goal_amount[step_up]
+        step_r = r_monthly[step_up]
+        step_rate = step_up_rate[step_up]
+        years = np.full(len(corpus), "60+", dtype=object)
+        done = np.zeros(len(corpus), dtype=bool)
+
+        for year in range(1, 61):
+            for _ in range(12):
+                corpus = (corpus + monthly_sip) * (1 + step_r)
+            reached = (corpus >= step_goal) & ~done
+            years[reached] = year
+            done |= reached
+            if done.all():
+                break
+            monthly_sip = monthly_sip * (1 + step_rate)
+
+        tenures[step_up] = years
+
+    return pd.Series(tenures, index=goals.index)
+
 def _get_historical_performance(tickers, years=15):
     """
     Fetches historical data for a list of tickers and calculates
     annualized return, volatility (risk), and Sharpe ratio.
+    Prices come from the shared adjusted-close matrix (see market_data_helper),
+    so worker processes map one copy instead of each downloading their own.
     """
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=years * 365.25)
-    
-    performance_data = []
-    
     try:
-        data = yf.download(
-            tickers, 
-            start=start_date, 
-            end=end_date, 
-            group_by='ticker', 
-            auto_adjust=False
-        )
+        matrix, start_date = get_price_matrix(tickers, years)
         
-        if data.empty:
+        if matrix is None:
              print("YFinance returned no data.")
              return []
 
+        available = [t for t in tickers if t in matrix]
         for ticker in tickers:
-            try:
-                ticker_data = data[ticker]['Adj Close']
-                
-                if ticker_data.isnull().all(): 
-                    print(f"Warning: No 'Adj Close' data for {ticker}. Skipping.")
-                    continue
-
-                log_returns = np.log(ticker_data / ticker_data.shift(1)).dropna()
-                
-                if log_returns.empty:
-                    print(f"Warning: No return data for {ticker}. Skipping.")
-                    continue
-
-                annual_return = log_returns.mean() * 252
-                annual_volatility = log_returns.std() * np.sqrt(252)
+            if ticker not in available:
+                print(f"Warning: No 'Adj Close' data for {ticker}. Skipping.")
+        if not available:
+            return []
 
-                sharpe_ratio = annual_return / annual_volatility if annual_volatility != 0 else 0
-                
-                performance_data.append({
-                    "ticker": ticker,
-                    "annual_return_pct": round(annual_return * 100, 2),
-                    "annual_volatility_pct": round(annual_volatility * 100, 2),
-                    "sharpe_ratio": round(sharpe_ratio, 2)
-                })
-            except Exception as inner_e:
-                print(f"Error processing {ticker}: {inner_e}")
-                
+        with span("analytics.performance", tickers=len(available), version=matrix.version):
+            performance_data = _compute_performance(matrix.window(available, start_date), available)
         return performance_data
         
     except Exception as e:
         print(f"Error in historical performance calculation: {e}")
         return []
 
-def get_investment_basket(chat_model, goal_amount, risk_profile, investment_type, amount, tenure_years):
+def _compute_performance(prices, tickers):
     """
-    Generates a personalized investment basket recommendation using LLM and data analysis.
+    Annualized return, volatility and Sharpe ratio per ticker from a
+    (tickers, dates) adjusted-close array, one row per ticker in order.
     """
-    try:
-        ASSET_UNIVERSE = [
-            # US Equity (Large Cap)
-            'VOO',  # S&P 500
-            'VUG',  # S&P 500 Growth
-            'VTV',  # S&P 500 Value
-            
-            # US Equity (Mid/Small Cap)
-            'VO',   # Mid-Cap
-            'VB',   # Small-Cap
-            
-            # US Tech / Sectors
-            'QQQ',  # NASDAQ 100
-            'XLK',  # Technology
-            'XLF',  # Financials
-            'XLV',  # Health Care
-            'XLE',  # Energy
-            
-            # International Equity
-            'VEU',  # All-World ex-US
-            'EEM',  # Emerging Markets
-            'EFA',  # Developed (EAFE)
-            'VGK',  # Europe
-            
-            # Bonds (Government)
-            'BND',  # Total US Bond Market
-            'TLT',  # 20+ Year Treasury
-            'SHY',  # 1-3 Year Treasury
-            'BNDX', # Total International Bond
-            
-            # Bonds (Corporate)
-            'LQD',  # Investment Grade Corporate
-            'HYG',  # High-Yield Corporate (Junk)
+    performance_data = []
+    for i, ticker in enumerate(tickers):
+        try:
+            ticker_data = np.asarray(prices[i], dtype=np.float64)
             
-            # Real Estate
-            'VNQ',  # US Real Estate
-            'VNQI', # International Real Estate
+            if np.isnan(ticker_data).all(): 
+                print(f"Warning: No 'Adj Close' data for {ticker}. Skipping.")
+                continue
+
+            log_returns = np.log(ticker_data[1:] / ticker_data[:-1])
+            log_returns = log_returns[~np.isnan(log_returns)]
             
-            # Commodities
-            'GLD',  # Gold
-            'SLV',  # Silver
-            'DBC',  # Broad Commodities (Oil, Gas, Gold, etc.)
+            if log_returns.size < 2:
+                print(f"Warning: No return data for {ticker}. Skipping.")
+                continue
+
+            annual_return = log_returns.mean() * 252
+            annual_volatility = log_returns.std(ddof=1) * np.sqrt(252)
+
+            sharpe_ratio = annual_return / annual_volatility if annual_volatility != 0 else 0
             
-            # Crypto (Note: yfinance uses -USD)
-            'BTC-USD', # Bitcoin
-            'ETH-USD'  # Ethereum
-        ]
+            performance_data.append({
+                "ticker": ticker,
+                "annual_return_pct": round(annual_return * 100, 2),
+                "annual_volatility_pct": round(annual_volatility * 100, 2),
+                "sharpe_ratio": round(sharpe_ratio, 2)
+            })
+        except Exception as inner_e:
+            print(f"Error processing {ticker}: {inner_e}")
 
+    return performance_data
+
+def _select_assets(performance_data, risk_profile):
+    """Pick the top 5 assets for a risk profile and the news query that goes with them."""
+    if risk_profile == "Low Risk":
+        low_risk_candidates = [p for p in performance_data if p['annual_volatility_pct'] < 20 and 'HYG' not in p['ticker'] and '-USD' not in p['ticker']]
+        top_assets = sorted(low_risk_candidates, key=lambda x: x['annual_volatility_pct'])[:5] 
+        search_query = "market outlook for low-volatility assets like bonds and stable ETFs"
+    elif risk_profile == "Medium Risk":
+        medium_risk_candidates = [p for p in performance_data if p['annual_volatility_pct'] < 35]
+        top_assets = sorted(medium_risk_candidates, key=lambda x: x['sharpe_ratio'], reverse=True)[:5] 
+        search_query = "market outlook for balanced assets like S&P 500 and diversified ETFs"
+    else: 
+        high_risk_candidates = [p for p in performance_data if p['annual_return_pct'] > 5] 
+        top_assets = sorted(high_risk_candidates, key=lambda x: x['sharpe_ratio'], reverse=True)[:5] 
+        search_query = "market outlook for high-growth assets like NASDAQ, Bitcoin, and emerging markets"
+    return top_assets, search_query
+
+def _build_context(performance_data, risk_profile, report=None):
+    """
+    Builds the DATA-DRIVEN CONTEXT block for a risk profile: historical stats,
+    live quotes for the selected tickers and recent news.
+    """
+    top_assets, search_query = _select_assets(performance_data, risk_profile)
+
+    dynamic_tickers = [asset['ticker'] for asset in top_assets]
+    print(f"Dynamically selected tickers: {dynamic_tickers}")
+
+    context_str = "--- START DATA-DRIVEN CONTEXT ---\n"
+    context_str += f"Here is the 15-year performance analysis for assets matching your '{risk_profile}' profile (Return vs. Risk):\n"
+    for asset in top_assets:
+        context_str += f"- {asset['ticker']}: Return={asset['annual_return_pct']}%, Risk={asset['annual_volatility_pct']}%, Sharpe={asset['sharpe_ratio']}\n"
+    
+    search_tool = get_web_search_tool()
+
+    if report:
+        report("Fetching live quotes...", 0.4)
+    for ticker in dynamic_tickers:
+        stock_data = get_stock_data.invoke(ticker)
+        context_str += f"\nLive Data for {ticker}:\n{stock_data}\n"
+
+    if search_tool:
+        if report:
+            report("Searching recent market news...", 0.6)
+        with span("tavily.search", query=search_query):
+            news = search_tool.invoke(search_query)
+        context_str += f"\nRecent Market News:\n{news}\n"
+    context_str += "--- END CONTEXT ---"
+    return context_str
+
+def build_basket_messages(context_str, goal_amount, risk_profile, investment_type, amount, tenure_years):
+    """Assembles the system + human messages for the basket recommendation."""
+    system_prompt = f"""
+    You are an expert financial planner named "NeoFin".
+    You are building a investment plan for a user with a **{risk_profile}** risk appetite.
+    You MUST adhere to this risk profile.
+    
+    **CRITICAL_RULE**: You must NEVER give a "buy" or "sell" recommendation. 
+    Instead of "you should buy AAPL," suggest asset allocations and representative examples.
+    ALWAYS provide a disclaimer that this is not financial advice.
+    
+    You MUST use the provided "DATA-DRIVEN CONTEXT" to build your recommendation.
+    This context contains a list of assets *dynamically selected* to match the user's risk profile,
+    based on 15 years of performance data (Return vs. Risk vs. Sharpe Ratio).
+    
+    Your job is to synthesize this data and present it as a coherent plan.
+    """
+    
+    human_message = f"""
+    Here is my financial goal:
+    - **Goal Amount:** ${goal_amount:,.2f}
+    - **Investment Plan:** ${amount:,.2f} as a {investment_type}
+    - **My Risk Profile:** {risk_profile}
+    - **Calculated Time Horizon:** {tenure_years} years
+    
+    Based on all of this, and especially the provided data-driven context, please provide a recommended investment basket.
+    
+    Your response should include:
+    1.  A suggested **Asset Allocation** (e.g., X% Equity, Y% Bonds, Z% Alternatives).
+    2.  For each asset class, provide 1-2 **representative examples** from the "DATA-DRIVEN CONTEXT", explaining *why* their historical risk/return profile (e.g., "high Sharpe ratio") fits my goal.
+    3.  A brief justification for why this basket aligns with my risk profile.
+    4.  The mandatory disclaimer.
+    """
+    
+    messages = [
+        SystemMessage(content=system_prompt + "\n\n" + context_str),
+        HumanMessage(content=human_message)
+    ]
+    return messages
+
+def build_market_contexts(risk_profiles):
+    """
+    Downloads the market data once and builds the context for each risk profile.
+    Returns {risk_profile: context_str}, or {} if no market data could be fetched.
+    Unknown risk profiles are skipped rather than falling through to High Risk.
+    Used by batch planning so every client shares one market snapshot.
+    """
+    risk_profiles = {risk_profile for risk_profile in risk_profiles if risk_profile in EXPECTED_RETURNS}
+    if not risk_profiles:
+        return {}
+
+    print("Fetching historical performance data...")
+    performance_data = _get_historical_performance(ASSET_UNIVERSE, years=15)
+    print(f"Found {len(performance_data)} assets with valid data.")
+
+    if not performance_data:
+        return {}
+
+    return {risk_profile: _build_context(performance_data, risk_profile) for risk_profile in risk_profiles}
+
+def get_investment_basket(chat_model, goal_amount, risk_profile, investment_type, amount, tenure_years, progress_callback=None):
+    """
+    Generates a personalized investment basket recommendation using LLM and data analysis.
+    If given, progress_callback(stage, progress) is called as each stage starts.
+    """
+    def report(stage, progress):
+        if progress_callback:
+            progress_callback(stage, progress)
+
+    try:
         print("Fetching historical performance data...")
+        report("Downloading 15 years of market data...", 0.1)
         performance_data = _get_historical_performance(ASSET_UNIVERSE, years=15)
         print(f"Found {len(performance_data)} assets with valid data.")
         
         if not performance_data:
             return "Error: Could not retrieve historical market data to build your plan. Please try again later."
 
-        top_assets = []
-        if risk_profile == "Low Risk":
-            low_risk_candidates = [p for p in performance_data if p['annual_volatility_pct'] < 20 and 'HYG' not in p['ticker'] and '-USD' not in p['ticker']]
-            top_assets = sorted(low_risk_candidates, key=lambda x: x['annual_volatility_pct'])[:5] 
-            search_query = "market outlook for low-volatility assets like bonds and stable ETFs"
-        elif risk_profile == "Medium Risk":
-            medium_risk_candidates = [p for p in performance_data if p['annual_volatility_pct'] < 35]
-            top_assets = sorted(medium_risk_candidates, key=lambda x: x['sharpe_ratio'], reverse=True)[:5] 
-            search_query = "market outlook for balanced assets like S&P 500 and diversified ETFs"
-        else: 
-            high_risk_candidates = [p for p in performance_data if p['annual_return_pct'] > 5] 
-            top_assets = sorted(high_risk_candidates, key=lambda x: x['sharpe_ratio'], reverse=True)[:5] 
-            search_query = "market outlook for high-growth assets like NASDAQ, Bitcoin, and emerging markets"
-
-        dynamic_tickers = [asset['ticker'] for asset in top_assets]
-        print(f"Dynamically selected tickers: {dynamic_tickers}")
-
-        context_str = "--- START DATA-DRIVEN CONTEXT ---\n"
-        context_str += f"Here is the 15-year performance analysis for assets matching your '{risk_profile}' profile (Return vs. Risk):\n"
-        for asset in top_assets:
-            context_str += f"- {asset['ticker']}: Return={asset['annual_return_pct']}%, Risk={asset['annual_volatility_pct']}%, Sharpe={asset['sharpe_ratio']}\n"
-        
-        search_tool = get_web_search_tool()
-
-        for ticker in dynamic_tickers:
-            stock_data = get_stock_data.invoke(ticker)
-            context_str += f"\nLive Data for {ticker}:\n{stock_data}\n"
-
-        if search_tool:
-            news = search_tool.invoke(search_query)
-            context_str += f"\nRecent Market News:\n{news}\n"
-        context_str += "--- END CONTEXT ---"
-
-        system_prompt = f"""
-        You are an expert financial planner named "NeoFin".
-        You are building a investment plan for a user with a **{risk_profile}** risk appetite.
-        You MUST adhere to this risk profile.
-        
-        **CRITICAL_RULE**: You must NEVER give a "buy" or "sell" recommendation. 
-        Instead of "you should buy AAPL," suggest asset allocations and representative examples.
-        ALWAYS provide a disclaimer that this is not financial advice.
-        
-        You MUST use the provided "DATA-DRIVEN CONTEXT" to build your recommendation.
-        This context contains a list of assets *dynamically selected* to match the user's risk profile,
-        based on 15 years of performance data (Return vs. Risk vs. Sharpe Ratio).
-        
-        Your job is to synthesize this data and present it as a coherent plan.
-        """
-        
-        human_message = f"""
-        Here is my financial goal:
-        - **Goal Amount:** ${goal_amount:,.2f}
-        - **Investment Plan:** ${amount:,.2f} as a {investment_type}
-        - **My Risk Profile:** {risk_profile}
-        - **Calculated Time Horizon:** {tenure_years} years
-        
-        Based on all of this, and especially the provided data-driven context, please provide a recommended investment basket.
-        
-        Your response should include:
-        1.  A suggested **Asset Allocation** (e.g., X% Equity, Y% Bonds, Z% Alternatives).
-        2.  For each asset class, provide 1-2 **representative examples** from the "DATA-DRIVEN CONTEXT", explaining *why* their historical risk/return profile (e.g., "high Sharpe ratio") fits my goal.
-        3.  A brief justification for why this basket aligns with my risk profile.
-        4.  The mandatory disclaimer.
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt + "\n\n" + context_str),
-            HumanMessage(content=human_message)
-        ]
+        context_str = _build_context(performance_data, risk_profile, report)
+        messages = build_basket_messages(context_str, goal_amount, risk_profile, investment_type, amount, tenure_years)
 
         print("Generating LLM recommendation...")
-        response = chat_model.invoke(messages)
+        report("Generating your recommendation...", 0.8)
+        with span("groq.basket") as attrs:
+            response = chat_model.invoke(messages)
+            record_llm_usage("groq.basket", attrs, response)
         return response.content
         
     except Exception as e:
         print(f"Error getting investment basket: {e}")
-        return f"An error occurred while generating the recommendation: {e}"
\ No newline at end of file
+        return f"An error occurred while generating the recommendation: {e}"
+
+def build_plan(chat_model, goal_amount, risk_profile, investment_type, amount, annual_rate, is_step_up, step_up_percent, progress_callback=None):
+    """
+    Runs the full "Build My Plan" pipeline: tenure first, then the basket if the goal is reachable.
+    Safe to run off the Streamlit script thread (no st.* calls).
+    """
+    if progress_callback:
+        progress_callback("Calculating time horizon...", 0.05)
+
+    tenure_years = calculate_tenure(goal_amount, investment_type, amount, annual_rate, is_step_up, step_up_percent)
+
+    basket_recommendation = None
+    if not isinstance(tenure_years, str):
+        basket_recommendation = get_investment_basket(
+            chat_model,
+            goal_amount,
+            risk_profile,
+            investment_type,
+            amount,
+            tenure_years,
+            progress_callback=progress_callback
+        )
+
+    return {
+        "goal_amount": goal_amount,
+        "tenure_years": tenure_years,
+        "basket_recommendation": basket_recommendation,
+    }
@@ -0,0 +1,144 @@
+# utils/job_helper.py
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config.config import settings
+from utils.trace_helper import start_trace, record_cache
+
+# Finished jobs are kept around this long so a rerun can still pick up the result.
+FINISHED_JOB_TTL_SECONDS = 15 * 60
+
+
+class Job:
+    """State of a single background job, shared by every session waiting on it."""
+
+    def __init__(self, job_id, key):
+        self.job_id = job_id
+        self.key = key
+        self.status = "queued"
+        self.stage = "Waiting for a free worker..."
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.trace = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def report(self, stage, progress):
+        """Progress callback handed to the job function."""
+        with self._lock:
+            self.stage = stage
+            self.progress = max(0.0, min(1.0, progress))
+
+    def snapshot(self):
+        """Return a consistent copy of the job state for the UI."""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": self.progress,
+                "result": self.result,
+                "error": self.error,
+                "trace": self.trace,
+            }
+
+
+class JobExecutor:
+    """
+    Bounded worker pool for slow work triggered from the UI.
+    Identical requests that are still queued or running share one job.
+    """
+
+    def __init__(self, max_workers=2, max_queue=8):
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="neofin-job")
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Queue fn(*args, progress_callback=..., **kwargs) and return its job id.
+        Returns the id of the in-flight job if one with the same key exists,
+        or None if the queue is full.
+        """
+        with self._lock:
+            self._prune()
+
+            existing = self._inflight.get(key)
+            record_cache("job_coalesce", existing is not None)
+            if existing:
+                return existing.job_id
+
+            if len(self._inflight) >= self.max_queue:
+                print(f"Job queue is full ({self.max_queue} jobs). Rejecting request.")
+                return None
+
+            job = Job(uuid.uuid4().hex, key)
+            self._jobs[job.job_id] = job
+            self._inflight[key] = job
+
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.job_id
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def _run(self, job, fn, args, kwargs):
+        with job._lock:
+            job.status = "running"
+        try:
+            with start_trace(job.key.split(":")[0]) as trace:
+                result = fn(*args, progress_callback=job.report, **kwargs)
+            with job._lock:
+                job.trace = trace.to_dict()
+                job.result = result
+                job.status = "done"
+                job.stage = "Done"
+                job.progress = 1.0
+        except Exception as e:
+            print(f"Error in background job {job.job_id}: {e}")
+            with job._lock:
+                job.error = str(e)
+                job.status = "failed"
+        finally:
+            with self._lock:
+                job.finished_at = time.time()
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+
+    def _prune(self):
+        """Drop finished jobs older than the TTL. Caller must hold self._lock."""
+        cutoff = time.time() - FINISHED_JOB_TTL_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def make_job_key(name, **params):
+    """Build a stable key so identical requests coalesce onto one job."""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return f"{name}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """Return the process-wide job executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = JobExecutor(
+                max_workers=settings.get("job_max_workers", 2),
+                max_queue=settings.get("job_max_queue", 8),
+            )
+        return _executor
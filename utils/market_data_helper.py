@@ -0,0 +1,303 @@
+# utils/market_data_helper.py
+import json
+import os
+import threading
+import time
+import numpy as np
+import yfinance as yf
+from datetime import datetime, timedelta
+from config.config import settings
+from utils.trace_helper import span, record_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, each process may refresh on its own.
+    fcntl = None
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "refresh.lock"
+
+
+class PriceMatrix:
+    """
+    Read-only view of a published adjusted-close matrix.
+    prices is float32 with shape (tickers, dates) and is memory-mapped, so every
+    worker process shares the same physical pages.
+    """
+
+    def __init__(self, version, tickers, dates, prices):
+        self.version = version
+        self.tickers = tickers
+        self.dates = dates
+        self.prices = prices
+        self._rows = {ticker: i for i, ticker in enumerate(tickers)}
+
+    def __contains__(self, ticker):
+        return ticker in self._rows
+
+    def window(self, tickers, start_date):
+        """
+        Rows for the given tickers from start_date onwards. This is a zero-copy
+        view when the tickers are a contiguous run of the published order
+        (always the case for the asset universe); otherwise rows are gathered.
+        """
+        first = int(np.searchsorted(self.dates, _to_day(start_date)))
+        rows = [self._rows[t] for t in tickers]
+        if rows == list(range(rows[0], rows[0] + len(rows))):
+            return self.prices[rows[0]:rows[0] + len(rows), first:]
+        return self.prices[rows, first:]
+
+
+def _to_day(value):
+    """Days since the epoch, the unit the dates array is stored in."""
+    return np.datetime64(value, "D").astype(np.int64)
+
+
+def _data_dir():
+    path = settings.get("market_data_dir")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _read_manifest(data_dir):
+    try:
+        with open(os.path.join(data_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish_price_matrix(tickers, years=15):
+    """
+    Downloads adjusted closes and publishes them as a new matrix version.
+    The data files are written first and the manifest is swapped in atomically,
+    so readers only ever see a complete version. Tickers that come back with no
+    data are left out and listed under "missing" so a later call retries them.
+    """
+    data_dir = _data_dir()
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=years * 365.25)
+
+    adj_close, failed = _download_adj_close(tickers, start_date, end_date)
+    if adj_close is None:
+        return None
+
+    prices = np.ascontiguousarray(adj_close.to_numpy(dtype=np.float32).T)
+    dates = adj_close.index.values.astype("datetime64[D]").astype(np.int64)
+    now = time.time()
+    return _write_version(data_dir, list(adj_close.columns), dates, prices, {t: now for t in failed}, created_at=now)
+
+
+def _merge_missing_tickers(data_dir, manifest, tickers):
+    """
+    Retries only `tickers` (absent from the current version) over the current
+    version's date range and appends the ones that now have data as a new version.
+    If none do, only their retry timestamps are updated: the version and data
+    files stay as they are, so workers keep their mapping.
+    """
+    dates = np.load(os.path.join(data_dir, manifest["dates_file"]))
+    start_date = datetime(1970, 1, 1) + timedelta(days=int(dates[0]))
+    adj_close, failed = _download_adj_close(tickers, start_date, datetime.now())
+
+    now = time.time()
+    missing = {t: ts for t, ts in manifest.get("missing", {}).items() if t not in tickers}
+    missing.update({t: now for t in failed})
+
+    if adj_close is None:
+        manifest = dict(manifest, missing=missing)
+        _write_manifest(data_dir, manifest)
+        print(f"Still no data for {list(tickers)}. Keeping price matrix v{manifest['version']}.")
+        return manifest
+
+    # Align to the published calendar; days outside it wait for the next full refresh.
+    adj_close = adj_close.reindex(dates.astype("datetime64[D]").astype("datetime64[ns]"))
+    current = np.memmap(os.path.join(data_dir, manifest["prices_file"]), dtype=np.float32, mode="r", shape=tuple(manifest["shape"]))
+    prices = np.vstack([current, adj_close.to_numpy(dtype=np.float32).T])
+    # Keep created_at: the rows that were already published are no fresher than before.
+    return _write_version(data_dir, manifest["tickers"] + list(adj_close.columns), dates, prices, missing, created_at=manifest["created_at"])
+
+
+def _download_adj_close(tickers, start_date, end_date):
+    """
+    Returns (adjusted closes with one column per ticker that has data, tickers without data),
+    or (None, tickers) if nothing came back.
+    """
+    with span("yfinance.download", tickers=len(tickers), start=str(start_date.date())):
+        data = yf.download(tickers, start=start_date, end=end_date, auto_adjust=False, progress=False)
+
+    if data.empty:
+        print("YFinance returned no data.")
+        return None, list(tickers)
+
+    adj_close = data["Adj Close"]
+    if adj_close.ndim == 1:
+        # Older yfinance returns flat columns for a single ticker.
+        adj_close = adj_close.to_frame(tickers[0])
+    adj_close = adj_close.reindex(columns=tickers)
+
+    failed = [t for t in tickers if adj_close[t].isnull().all()]
+    if failed:
+        print(f"Warning: No 'Adj Close' data for {failed}. Will retry later.")
+    found = [t for t in tickers if t not in failed]
+    if not found:
+        print("YFinance returned no data.")
+        return None, list(tickers)
+    return adj_close[found], failed
+
+
+def _write_version(data_dir, tickers, dates, prices, missing, created_at):
+    """Write the data files for the next version, then swap its manifest in."""
+    previous = _read_manifest(data_dir)
+    version = (previous["version"] + 1) if previous else 1
+
+    prices_file = f"prices_v{version}.f32"
+    dates_file = f"dates_v{version}.npy"
+    prices.tofile(os.path.join(data_dir, prices_file))
+    np.save(os.path.join(data_dir, dates_file), dates)
+
+    manifest = {
+        "version": version,
+        "tickers": list(tickers),
+        "missing": missing,
+        "shape": list(prices.shape),
+        "prices_file": prices_file,
+        "dates_file": dates_file,
+        "created_at": created_at,
+    }
+    _write_manifest(data_dir, manifest)
+
+    _remove_old_versions(data_dir, keep={version, version - 1})
+    print(f"Published price matrix v{version}: {prices.shape[0]} tickers x {prices.shape[1]} days.")
+    return manifest
+
+
+def _write_manifest(data_dir, manifest):
+    tmp_path = os.path.join(data_dir, f"{MANIFEST_NAME}.tmp{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(data_dir, MANIFEST_NAME))
+
+
+def _remove_old_versions(data_dir, keep):
+    # Processes still mapping a removed file keep their pages until they remap (POSIX unlink semantics).
+    for name in os.listdir(data_dir):
+        if name.startswith(("prices_v", "dates_v")):
+            try:
+                version = int(name.split("_v")[1].split(".")[0])
+            except ValueError:
+                continue
+            if version not in keep:
+                try:
+                    os.remove(os.path.join(data_dir, name))
+                except OSError:
+                    pass
+
+
+_mapped = None
+_mapped_lock = threading.Lock()
+# Serialises refreshes within this process; flock does the same across processes.
+_refresh_lock = threading.Lock()
+
+
+def _map(data_dir, manifest):
+    """Map a published version read-only. Reuses the current mapping if it is already this version."""
+    global _mapped
+    if _mapped and _mapped.version == manifest["version"]:
+        return _mapped
+
+    prices = np.memmap(os.path.join(data_dir, manifest["prices_file"]), dtype=np.float32, mode="r", shape=tuple(manifest["shape"]))
+    dates = np.load(os.path.join(data_dir, manifest["dates_file"]), mmap_mode="r")
+    _mapped = PriceMatrix(manifest["version"], manifest["tickers"], dates, prices)
+    return _mapped
+
+
+def _refresh(data_dir, tickers, years, blocking):
+    """
+    Publish a new version if this thread wins both the in-process and the
+    cross-process refresh locks. Returns the manifest current after the attempt,
+    or None if someone else is refreshing and blocking is False.
+    """
+    if not _refresh_lock.acquire(blocking=blocking):
+        return None
+    try:
+        if fcntl is None:
+            return _publish_if_needed(data_dir, tickers, years)
+
+        with open(os.path.join(data_dir, LOCK_NAME), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return None
+            try:
+                return _publish_if_needed(data_dir, tickers, years)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        _refresh_lock.release()
+
+
+def _publish_if_needed(data_dir, tickers, years):
+    # Another thread or process may have published while we waited for the lock.
+    manifest = _read_manifest(data_dir)
+    if not _needs_refresh(manifest, tickers):
+        return manifest
+    if manifest is None or _is_stale(manifest):
+        return publish_price_matrix(_wanted_tickers(manifest, tickers), years) or manifest
+    # The data is fresh; only absent tickers are due, so fetch just those.
+    return _merge_missing_tickers(data_dir, manifest, _due_tickers(manifest, tickers))
+
+
+def _is_stale(manifest):
+    return time.time() - manifest["created_at"] > settings.get("market_data_max_age_seconds", 21600)
+
+
+def _needs_refresh(manifest, tickers):
+    """True if there is no data, it is stale, or a requested ticker is absent and not in its retry backoff."""
+    if manifest is None or _is_stale(manifest):
+        return True
+    return any(t in tickers for t in _due_tickers(manifest, tickers))
+
+
+def _due_tickers(manifest, tickers):
+    """Requested or previously missing tickers that are absent and past their retry backoff."""
+    published = set(manifest["tickers"])
+    missing = manifest.get("missing", {})
+    retry_seconds = settings.get("market_data_retry_seconds", 300)
+    return [
+        t for t in dict.fromkeys(list(tickers) + list(missing))
+        if t not in published and time.time() - missing.get(t, 0) > retry_seconds
+    ]
+
+
+def _wanted_tickers(manifest, tickers):
+    """Everything published or previously missing, plus the requested tickers, in a stable order."""
+    known = (manifest["tickers"] + list(manifest.get("missing", {}))) if manifest else []
+    return list(dict.fromkeys(known + list(tickers)))
+
+
+def get_price_matrix(tickers, years=15):
+    """
+    Returns (PriceMatrix, start_date) for the last `years`, refreshing the shared
+    file first if it is missing, stale or lacks a requested ticker.
+    Tickers yfinance had no data for are absent from the matrix (check with
+    `ticker in matrix`) and are only retried after MARKET_DATA_RETRY_SECONDS.
+    While another thread or process refreshes existing data, the current
+    version is used as is; callers only wait when there is nothing to use yet.
+    Returns (None, start_date) if no data could be published.
+    """
+    data_dir = _data_dir()
+    start_date = datetime.now() - timedelta(days=years * 365.25)
+
+    manifest = _read_manifest(data_dir)
+    if _needs_refresh(manifest, tickers):
+        record_cache("price_matrix", False)
+        attempted = (set(manifest["tickers"]) | set(manifest.get("missing", {}))) if manifest else set()
+        blocking = manifest is None or not set(tickers) <= attempted
+        manifest = _refresh(data_dir, tickers, years, blocking) or manifest
+    else:
+        record_cache("price_matrix", True)
+
+    if manifest is None:
+        return None, start_date
+    with _mapped_lock:
+        return _map(data_dir, manifest), start_date
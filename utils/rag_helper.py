@@ -2,15 +2,20 @@
 import pdfplumber
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.trace_helper import span
 
 def get_pdf_text(pdf_docs):
     """Extract text from a list of uploaded PDF files."""
     try:
-        text = ""
-        for pdf in pdf_docs:
-            with pdfplumber.open(pdf) as pdf_reader:
-                for page in pdf_reader.pages:
-                    text += page.extract_text() or ""
+        with span("rag.pdf_extract", files=len(pdf_docs)) as attrs:
+            text = ""
+            pages = 0
+            for pdf in pdf_docs:
+                with pdfplumber.open(pdf) as pdf_reader:
+                    for page in pdf_reader.pages:
+                        text += page.extract_text() or ""
+                        pages += 1
+            attrs["pages"] = pages
         return text
     except Exception as e:
         print(f"Error reading PDF text: {e}")
@@ -23,7 +28,9 @@ def get_text_chunks(text):
             chunk_size=1000,
             chunk_overlap=200
         )
-        chunks = text_splitter.split_text(text)
+        with span("rag.split", chars=len(text)) as attrs:
+            chunks = text_splitter.split_text(text)
+            attrs["chunks"] = len(chunks)
         return chunks
     except Exception as e:
         print(f"Error splitting text: {e}")
@@ -36,7 +43,8 @@ def get_vector_store(text_chunks, embeddings):
             print("Embeddings model not available. Cannot create vector store.")
             return None
 
-        vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
+        with span("rag.embed_index", chunks=len(text_chunks)):
+            vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
         return vector_store.as_retriever()
     except Exception as e:
         print(f"Error creating vector store: {e}")
@@ -0,0 +1,308 @@
+# utils/session_helper.py
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+from collections import OrderedDict
+from langchain_community.vectorstores import FAISS
+from config.config import settings
+from utils.trace_helper import span, record_cache
+
+MB = 1024 * 1024
+
+
+def estimate_retriever_bytes(retriever):
+    """Rough resident size of a FAISS retriever: vectors plus stored chunk text."""
+    try:
+        vector_store = retriever.vectorstore
+        index_bytes = vector_store.index.ntotal * vector_store.index.d * 4
+        text_bytes = sum(len(doc.page_content.encode("utf-8")) for doc in vector_store.docstore._dict.values())
+        return index_bytes + text_bytes
+    except Exception as e:
+        print(f"Could not estimate retriever size: {e}")
+        return 0
+
+
+def estimate_history_bytes(messages):
+    """Rough resident size of a chat history list."""
+    return sum(sys.getsizeof(msg.get("content", "")) for msg in messages)
+
+
+class _SessionEntry:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.retriever = None
+        self.retriever_bytes = 0
+        self.history_bytes = 0
+        self.spill_path = None
+        self.spilling = False
+        self.last_access = time.time()
+
+
+class SessionResourceManager:
+    """
+    Keeps per-session FAISS retrievers under per-session and global memory caps.
+    Idle or least-recently-used retrievers are written to disk and reloaded
+    on the next query, so abandoned tabs stop holding memory.
+    """
+
+    def __init__(self, spill_dir, session_max_bytes, global_max_bytes, idle_seconds, disk_ttl_seconds):
+        self.spill_dir = _private_dir(spill_dir)
+        self.session_max_bytes = session_max_bytes
+        self.global_max_bytes = global_max_bytes
+        self.idle_seconds = idle_seconds
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self._sessions = OrderedDict()
+        # Guards bookkeeping only; saving, loading and deleting spills happen after it is released.
+        self._lock = threading.Lock()
+        self._orphan_scan_at = time.time()
+        self._remove_orphaned_spills(live_paths=set())
+
+    def put_retriever(self, session_id, retriever):
+        """
+        Register a freshly built retriever for a session.
+        Returns False if it is larger than the per-session cap.
+        """
+        size = estimate_retriever_bytes(retriever)
+        if size + self._history_bytes(session_id) > self.session_max_bytes:
+            print(f"Retriever for session {session_id} is {size / MB:.1f} MB, over the per-session cap.")
+            return False
+
+        with self._lock:
+            entry = self._touch(session_id)
+            stale_paths = self._detach_spill(entry)
+            entry.retriever = retriever
+            entry.retriever_bytes = size
+            to_spill, to_delete = self._sweep(keep=session_id)
+        self._apply(to_spill, stale_paths + to_delete)
+        return True
+
+    def get_retriever(self, session_id, embeddings):
+        """Return the session's retriever, reloading it from disk if it was spilled."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._touch(session_id)
+            record_cache("retriever", entry.retriever is not None)
+            retriever = entry.retriever
+            spill_path = entry.spill_path
+
+        if retriever is None and spill_path:
+            try:
+                with span("session.reload_retriever"):
+                    vector_store = FAISS.load_local(spill_path, embeddings, allow_dangerous_deserialization=True)
+                retriever = vector_store.as_retriever()
+                size = estimate_retriever_bytes(retriever)
+            except Exception as e:
+                print(f"Error reloading retriever for session {session_id}: {e}")
+                return None
+
+            with self._lock:
+                # Only install the reload if nothing replaced or dropped the spill meanwhile.
+                if self._sessions.get(session_id) is entry and entry.spill_path == spill_path:
+                    entry.retriever = retriever
+                    entry.retriever_bytes = size
+                    entry.spill_path = None
+                    stale_paths = [spill_path]
+                else:
+                    retriever = entry.retriever or retriever
+                    stale_paths = []
+                to_spill, to_delete = self._sweep(keep=session_id)
+            self._apply(to_spill, stale_paths + to_delete)
+            return retriever
+
+        with self._lock:
+            to_spill, to_delete = self._sweep(keep=session_id)
+        self._apply(to_spill, to_delete)
+        return retriever
+
+    def has_retriever(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return bool(entry and (entry.retriever is not None or entry.spill_path))
+
+    def record_history(self, session_id, messages):
+        """Track the chat history size so it counts towards the session's usage."""
+        with self._lock:
+            entry = self._touch(session_id)
+            entry.history_bytes = estimate_history_bytes(messages)
+            to_spill, to_delete = self._sweep(keep=session_id)
+        self._apply(to_spill, to_delete)
+
+    def release(self, session_id):
+        """Drop everything held for a session, in memory and on disk."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            stale_paths = self._detach_spill(entry) if entry else []
+        self._apply([], stale_paths)
+
+    def usage_report(self):
+        """Resident memory per session, in bytes, plus whether its retriever is on disk."""
+        with self._lock:
+            to_spill, to_delete = self._sweep()
+        self._apply(to_spill, to_delete)
+        with self._lock:
+            return {
+                entry.session_id: {
+                    "retriever_bytes": entry.retriever_bytes if entry.retriever is not None else 0,
+                    "history_bytes": entry.history_bytes,
+                    "spilled": entry.spill_path is not None,
+                    "idle_seconds": round(time.time() - entry.last_access),
+                }
+                for entry in self._sessions.values()
+            }
+
+    def _history_bytes(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry.history_bytes if entry else 0
+
+    def _touch(self, session_id):
+        """Get or create an entry and mark it most recently used. Caller must hold self._lock."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = _SessionEntry(session_id)
+            self._sessions[session_id] = entry
+        entry.last_access = time.time()
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _resident_bytes(self):
+        return sum(entry.retriever_bytes + entry.history_bytes for entry in self._sessions.values())
+
+    def _sweep(self, keep=None):
+        """
+        Pick idle retrievers to spill, then more in LRU order until under the global cap.
+        Sessions idle past the disk TTL are dropped entirely. Caller must hold self._lock.
+        Returns (entries to spill, paths to delete) for _apply once the lock is released.
+        """
+        now = time.time()
+        to_spill, to_delete = [], []
+
+        for entry in list(self._sessions.values()):
+            idle = now - entry.last_access
+            if entry.session_id != keep and idle > self.disk_ttl_seconds:
+                to_delete += self._detach_spill(entry)
+                del self._sessions[entry.session_id]
+            elif entry.retriever is not None and not entry.spilling and idle > self.idle_seconds:
+                entry.spilling = True
+                to_spill.append((entry, entry.retriever, entry.last_access))
+
+        # Retrievers already picked will be freed, so they no longer count towards the cap.
+        resident = self._resident_bytes() - sum(entry.retriever_bytes for entry, _, _ in to_spill)
+        for entry in list(self._sessions.values()):
+            if resident <= self.global_max_bytes:
+                break
+            if entry.session_id != keep and entry.retriever is not None and not entry.spilling:
+                entry.spilling = True
+                to_spill.append((entry, entry.retriever, entry.last_access))
+                resident -= entry.retriever_bytes
+
+        return to_spill, to_delete
+
+    def _apply(self, to_spill, to_delete):
+        """Do the disk work picked by _sweep and the periodic orphan scan. Must be called without self._lock held."""
+        for path in to_delete:
+            shutil.rmtree(path, ignore_errors=True)
+        for entry, retriever, last_access in to_spill:
+            self._spill(entry, retriever, last_access)
+
+        with self._lock:
+            if time.time() - self._orphan_scan_at <= self.idle_seconds:
+                return
+            self._orphan_scan_at = time.time()
+            live_paths = {entry.spill_path for entry in self._sessions.values() if entry.spill_path}
+        self._remove_orphaned_spills(live_paths)
+
+    def _spill(self, entry, retriever, last_access):
+        path = os.path.join(self.spill_dir, entry.session_id)
+        try:
+            with span("session.spill_retriever"):
+                retriever.vectorstore.save_local(path)
+        except Exception as e:
+            print(f"Error spilling retriever for session {entry.session_id}: {e}")
+            with self._lock:
+                entry.spilling = False
+            return
+
+        with self._lock:
+            entry.spilling = False
+            # Keep the retriever in memory if the session was used, replaced or released while saving.
+            current = (
+                self._sessions.get(entry.session_id) is entry
+                and entry.retriever is retriever
+                and entry.last_access == last_access
+            )
+            if current:
+                entry.spill_path = path
+                entry.retriever = None
+                entry.retriever_bytes = 0
+        if not current:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _remove_orphaned_spills(self, live_paths):
+        """
+        Delete spills left by earlier processes (restarts, crashes, redeploys) once
+        they are older than the disk TTL. Their sessions can never be reached again.
+        Younger ones are kept because another worker may share this directory.
+        Runs when the manager is created and then at most once per idle period.
+        """
+        cutoff = time.time() - self.disk_ttl_seconds
+        removed = 0
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if path in live_paths or not os.path.isdir(path) or os.path.islink(path):
+                    continue
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            print(f"Removed {removed} expired session spills from {self.spill_dir}.")
+
+    def _detach_spill(self, entry):
+        """Forget the entry's spill and return its path for deletion. Caller must hold self._lock."""
+        path = entry.spill_path
+        entry.spill_path = None
+        return [path] if path else []
+
+
+def _private_dir(path):
+    """
+    Create the spill directory readable only by this user. Spills are pickles that
+    are loaded back, so refuse a directory another user owns or could write to.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Session spill path {path} is not a directory.")
+    if hasattr(os, "getuid"):
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"Session spill directory {path} is owned by another user.")
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager():
+    """Return the process-wide session resource manager, creating it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SessionResourceManager(
+                spill_dir=settings.get("session_spill_dir"),
+                session_max_bytes=settings.get("session_max_mb", 256) * MB,
+                global_max_bytes=settings.get("global_session_max_mb", 1024) * MB,
+                idle_seconds=settings.get("session_idle_seconds", 600),
+                disk_ttl_seconds=settings.get("session_disk_ttl_seconds", 86400),
+            )
+        return _manager
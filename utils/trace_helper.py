@@ -0,0 +1,183 @@
+# utils/trace_helper.py
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config.config import settings
+
+_current_trace = contextvars.ContextVar("neofin_trace", default=None)
+
+
+class Trace:
+    """All spans recorded while handling one request (a chat turn, a plan job, ...)."""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_ms": self.duration_ms,
+                "spans": list(self.spans),
+            }
+
+
+class _Metrics:
+    """Process-wide aggregates behind the Prometheus export."""
+
+    def __init__(self):
+        self.spans = {}
+        self.tokens = {}
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    def observe_span(self, name, duration_seconds, error):
+        with self._lock:
+            stats = self.spans.setdefault(name, {"count": 0, "sum": 0.0, "errors": 0})
+            stats["count"] += 1
+            stats["sum"] += duration_seconds
+            stats["errors"] += int(error)
+
+    def add_tokens(self, name, direction, count):
+        with self._lock:
+            self.tokens[(name, direction)] = self.tokens.get((name, direction), 0) + count
+
+    def add_cache(self, name, hit):
+        with self._lock:
+            key = (name, "hit" if hit else "miss")
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+
+metrics = _Metrics()
+
+
+@contextmanager
+def start_trace(name):
+    """Collect every span recorded in this context (and its thread) into one Trace."""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.duration_ms = round((time.perf_counter() - trace._start) * 1000, 2)
+        _current_trace.reset(token)
+        _write_json_line(trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block and attach it to the current trace, if any.
+    Yields the attribute dict so the block can add details such as token counts.
+    """
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield attributes
+    except Exception:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe_span(name, duration, error)
+        if trace:
+            trace.add_span({
+                "name": name,
+                "offset_ms": round((start - trace._start) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                "error": error,
+                "attributes": attributes,
+            })
+
+
+def record_llm_usage(name, attributes, response):
+    """Copy token usage from a LangChain chat response onto a span and the token counters."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    tokens_in = usage.get("input_tokens", 0)
+    tokens_out = usage.get("output_tokens", 0)
+    attributes["tokens_in"] = tokens_in
+    attributes["tokens_out"] = tokens_out
+    metrics.add_tokens(name, "in", tokens_in)
+    metrics.add_tokens(name, "out", tokens_out)
+
+
+def record_cache(name, hit):
+    """Count a cache lookup and note it on the current trace."""
+    metrics.add_cache(name, hit)
+    trace = _current_trace.get()
+    if trace:
+        trace.add_span({
+            "name": f"cache.{name}",
+            "offset_ms": round((time.perf_counter() - trace._start) * 1000, 2),
+            "duration_ms": 0.0,
+            "error": False,
+            "attributes": {"hit": hit},
+        })
+
+
+def export_prometheus():
+    """Render the process-wide metrics in the Prometheus text exposition format."""
+    with metrics._lock:
+        lines = [
+            "# HELP neofin_span_duration_seconds Time spent in traced operations.",
+            "# TYPE neofin_span_duration_seconds summary",
+        ]
+        for name, stats in sorted(metrics.spans.items()):
+            lines.append(f'neofin_span_duration_seconds_sum{{span="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'neofin_span_duration_seconds_count{{span="{name}"}} {stats["count"]}')
+
+        lines += ["# HELP neofin_span_errors_total Traced operations that raised.", "# TYPE neofin_span_errors_total counter"]
+        for name, stats in sorted(metrics.spans.items()):
+            lines.append(f'neofin_span_errors_total{{span="{name}"}} {stats["errors"]}')
+
+        lines += ["# HELP neofin_llm_tokens_total LLM tokens by call site and direction.", "# TYPE neofin_llm_tokens_total counter"]
+        for (name, direction), count in sorted(metrics.tokens.items()):
+            lines.append(f'neofin_llm_tokens_total{{span="{name}",direction="{direction}"}} {count}')
+
+        lines += ["# HELP neofin_cache_requests_total Cache lookups by cache and result.", "# TYPE neofin_cache_requests_total counter"]
+        for (name, result), count in sorted(metrics.cache.items()):
+            lines.append(f'neofin_cache_requests_total{{cache="{name}",result="{result}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+def cache_hit_rates():
+    """Return {cache_name: hit_rate} for every cache seen so far."""
+    with metrics._lock:
+        names = {name for name, _ in metrics.cache}
+        rates = {}
+        for name in names:
+            hits = metrics.cache.get((name, "hit"), 0)
+            misses = metrics.cache.get((name, "miss"), 0)
+            rates[name] = hits / (hits + misses) if hits + misses else 0.0
+        return rates
+
+
+_jsonl_lock = threading.Lock()
+
+
+def _write_json_line(trace):
+    path = settings.get("trace_jsonl_path")
+    if not path:
+        return
+    try:
+        with _jsonl_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+    except Exception as e:
+        print(f"Error writing trace to {path}: {e}")